@@ -1,13 +1,31 @@
 from pymodbus.client.sync import ModbusTcpClient as ModbusClient
+from pymodbus.exceptions import ConnectionException, ModbusIOException
 from pymodbus.register_read_message import ReadHoldingRegistersResponse
 from typing import Union
 import logging
+import random
+import socket
+import threading
 import time
 import TypeConversion as TC
 
 logger = logging.getLogger(__name__)
 
+MAX_BLOCK_LENGTH = 125 # Maximum number of registers per read_holding_registers request
+RECONNECT_RETRIES = 5 # Connection attempts when a lost connection is reopened
+INITIAL_RECONNECT_DELAY = 0.05 # Delay in seconds after the first failed connection attempt, doubled after each further one
+MAX_RECONNECT_DELAY = 2.0 # Upper bound in seconds of the delay between two connection attempts
+VALUE_TYPES = {"float": float, "int": int, "bool": bool} # Datatypes of register values
+KEEPALIVE_OPTIONS = { # TCP keep-alive settings in seconds/probes, where supported by the platform
+    "TCP_KEEPIDLE": 30,
+    "TCP_KEEPINTVL": 10,
+    "TCP_KEEPCNT": 3,
+}
+
 class Modbus_device(object):
+    _client_pool:dict = {} # (ipAddress, port): [client, lock, number of devices using the client]
+    _client_pool_lock:threading.Lock = threading.Lock()
+
     def __init__(self, ipAddress:str, port:str="502", unitID:int=1):
         """Create a modbus device
 
@@ -18,44 +36,148 @@ class Modbus_device(object):
         """
         self.ipAddress:str = ipAddress
         self.port:str = port
-        if self.port:
-            self.client:ModbusClient = ModbusClient(self.ipAddress, port=self.port)
-        else:
-            self.client:ModbusClient = ModbusClient(self.ipAddress)
+        self.client:ModbusClient = None
+        self.lock:threading.RLock = None
+        self._client_key:tuple = None
         self.UnitID:int = unitID
         self.connected:bool = None
         self.connect()
         self.registers:dict[str,Modbus_register] = {}
+        self._poller:threading.Thread = None
+        self._poller_stop:threading.Event = threading.Event()
         pass
 
+    def _acquire_client(self) -> tuple:
+        # Devices with the same ip address and port share one client (and TCP connection),
+        # the UnitID distinguishes the devices on the wire. Returns the client and its lock.
+        key = (self.ipAddress, int(self.port) if self.port else 502)
+        with Modbus_device._client_pool_lock:
+            if self._client_key is not None:
+                return self.client, self.lock
+            entry = Modbus_device._client_pool.get(key)
+            if entry is None:
+                if self.port:
+                    client = ModbusClient(self.ipAddress, port=self.port)
+                else:
+                    client = ModbusClient(self.ipAddress)
+                entry = [client, threading.RLock(), 0] # pymodbus clients are not threadsafe
+                Modbus_device._client_pool[key] = entry
+            entry[2] += 1
+            self.client, self.lock = entry[0], entry[1]
+            self._client_key = key
+            return self.client, self.lock
+
+    def _release_client(self) -> tuple:
+        # Returns the client and its lock if this was the last device using the client, otherwise None
+        with Modbus_device._client_pool_lock:
+            if self._client_key is None:
+                return None
+            entry = Modbus_device._client_pool[self._client_key]
+            entry[2] -= 1
+            if entry[2] == 0:
+                del Modbus_device._client_pool[self._client_key]
+            self._client_key = None
+            self.client, self.lock = None, None
+        return (entry[0], entry[1]) if entry[2] == 0 else None
+
+    def _session(self) -> tuple:
+        # Client and lock for one whole operation, so close() in another thread can not remove them halfway.
+        # A closed device acquires a client from the pool again instead of reopening a released one.
+        with Modbus_device._client_pool_lock:
+            client, lock = self.client, self.lock
+        if client is None:
+            client, lock = self._acquire_client()
+            with lock:
+                self._ensure_connection(client)
+        return client, lock
+
     def connect(self):
         """Connect to modbus device
+
+        Raises:
+            ConnectionException: Device could not be connected
         """
-        retries = 10
-        i = 0
-        while i < retries:
+        client, lock = self._acquire_client()
+        if not self._connect(client, 10):
+            logger.error("Failed to connect to modbus device %s", self.ipAddress)
+            self._release_client()
+            raise ConnectionException("Failed to connect to modbus device {}:{}".format(self.ipAddress, self.port))
+
+    def _connect(self, client: ModbusClient, retries: int) -> bool:
+        # Exponential backoff with jitter, starting short to recover quickly from transient failures
+        delay = INITIAL_RECONNECT_DELAY
+        for i in range(retries):
             try:
-                self.connected = self.client.connect()
-                if self.connected:
-                    break
+                self.connected = client.connect()
             except:
-                logger.error("ModbusError: Connection to {}:{} failed!".format(self.ipAddress, self.port))
-            i += 1
-            time.sleep(2)
-        if not self.connected:
-            logger.error("Failed to connect to modbus device {}".format(self.ipAddress))
-            exit()
+                self.connected = False
+                logger.error("ModbusError: Connection to %s:%s failed!", self.ipAddress, self.port)
+            if self.connected:
+                self._enable_keepalive(client)
+                return True
+            if i < retries - 1:
+                time.sleep(delay + random.random() * delay * 0.1)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+        return False
+
+    def _enable_keepalive(self, client: ModbusClient):
+        sock = client.socket
+        if sock is None:
+            return
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            for option, value in KEEPALIVE_OPTIONS.items():
+                if hasattr(socket, option):
+                    sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+        except OSError as e:
+            logger.warning("TCP keep-alive could not be enabled: %s", e)
+
+    def reconnect(self) -> bool:
+        """Reopen a lost connection to the device
+
+        Returns:
+            bool: True if the connection is open again
+        """
+        client, lock = self._session()
+        with lock:
+            return self._reconnect(client)
+
+    def _reconnect(self, client: ModbusClient) -> bool:
+        logger.warning("Reconnecting to modbus device %s", self.ipAddress)
+        client.close()
+        return self._connect(client, RECONNECT_RETRIES)
+
+    def ensure_connection(self) -> bool:
+        """Reopen the connection to the device if it was closed
+
+        Returns:
+            bool: True if the connection is open
+        """
+        client, lock = self._session()
+        with lock:
+            return self._ensure_connection(client)
+
+    def _ensure_connection(self, client: ModbusClient) -> bool:
+        if client.socket is None:
+            return self._reconnect(client)
+        return True
 
     def close(self):
-        """Close connection to device
+        """Close connection to device. The connection stays open while other devices share it.
         """
+        self.stop_poller()
+        self.connected = False
+        released = self._release_client()
+        if released is None:
+            return
+        client, lock = released
         try:
-            self.client.close()
-            self.connected = False
+            with lock:
+                client.close()
         except:
             logger.warning("Connection could not be closed!")
 
-    def newRegister(self, name: str, address: int, length: int, signed:bool=False, factor:float=1, type_:str="int", unit:str="") -> bool:
+    def newRegister(self, name: str, address: int, length: int, signed:bool=False, factor:float=1, type_:str="int", unit:str="", ttl:float=0.0, scan_interval:float=0.0) -> bool:
         """Create a new register
 
         Args:
@@ -66,17 +188,16 @@ class Modbus_device(object):
             factor (float, optional): Factor to calculate value from register data. Defaults to 1.
             type_ (str, optional): Datatype of the register. Possible types: int, float, bool. Defaults to "int".
             unit (str, optional): Unit string of the value, e. g. " Wh" or " °C". Defaults to "".
+            ttl (float, optional): Time in seconds the data of the register is reused without reading the device. Defaults to 0.0.
+            scan_interval (float, optional): Interval in seconds the register is read by the poller. 0 disables polling. Defaults to 0.0.
+
+        The register is not read here, use validate_all() to check all registers with few requests.
 
         Returns:
             bool: true when creation was successful
         """
-        self.registers[name] = Modbus_register(address, length, signed, factor, type_, unit)
-        test = self.read(name) # Init values
-        if test:
-            return True
-        else:
-            del self.registers[name]
-            return False
+        self.registers[name] = Modbus_register(address, length, signed, factor, type_, unit, ttl, scan_interval)
+        return True
 
     def removeRegister(self, name: str):
         """Delete register from register dictionary
@@ -86,6 +207,19 @@ class Modbus_device(object):
         """
         del self.registers[name]
 
+    def validate_all(self, max_gap: int = 0) -> list:
+        """Read all registers with one request per block of registers and mark registers which could not be read.
+        The error attribute of these registers is set.
+
+        Args:
+            max_gap (int, optional): Maximum number of unused registers read between two registers of one request. Defaults to 0.
+
+        Returns:
+            list: Names of the registers which could not be read
+        """
+        self.read_blocks(self.registers.values(), max_gap)
+        return [name for name, register in self.registers.items() if register.error]
+
     def read(self, name: str) -> int:
         """Read raw data from a modbus register
 
@@ -93,12 +227,19 @@ class Modbus_device(object):
             name (str): Name of the register
 
         Returns:
-            int: Data read from the register
+            int: Data read from the register, None if the register could not be read
         """
-        try:
-            return self.registers[name].get_data(self.client, self.UnitID)
-        except:
-            logger.error("Error reading register "+name)
+        register = self.registers[name]
+        if register.scan_interval and self.polling:
+            # Polled data is read without the lock, the poller replaces it with a single assignment
+            return None if register.error else register.data
+        client, lock = self._session()
+        with lock:
+            data = self._request(client, lambda: register.get_data(client, self.UnitID),
+                                 lambda data: data is None and self._connection_lost(register.response))
+        if data is None:
+            register.error = 1
+        return data
 
     def read_value(self, name: str) -> Union[float, int, bool]:
         """Read the value from a modbus register
@@ -109,23 +250,11 @@ class Modbus_device(object):
         Returns:
             float/int/bool: Value of the register. Datatype is specified in the register.
         """
-        value = 0 # default value
-        try:
-            value = round(float(TC.list_to_number(self.read(name), signed=self.registers[name].signed) * self.registers[name].factor), 2)
-        except Exception as e:
-            logger.error("Error reading value from register "+name+", Exeption: "+str(e))
-
-        value_type = self.registers[name].type
-        if value_type == "float":
-            self.registers[name].value = float(value)
-        elif value_type == "int":
-            self.registers[name].value = int(value)
-        elif value_type == "bool":
-            if value == 0.0:
-                self.registers[name].value = False
-            else:
-                self.registers[name].value = True
-        return self.registers[name].value
+        register = self.registers[name]
+        data = self.read(name)
+        if data is None:
+            return register.value
+        return register.decode(data)
 
     def write_register(self, name: str, value: int):
         """Write data to modbus register
@@ -136,9 +265,14 @@ class Modbus_device(object):
         """
         register = self.registers[name]
         try:
-            register.write(self.client, value, self.UnitID)
+            client, lock = self._session()
+            with lock:
+                if not self._ensure_connection(client):
+                    logger.error("Error writing register %s, connection lost", name)
+                    return
+                register.write(client, value, self.UnitID)
         except:
-            logger.error("Error writing register "+name+" with value "+str(value))
+            logger.error("Error writing register %s with value %s", name, value)
 
     def read_string(self, name: str) -> str:
         """Read the value from a modbus register with name and unit string
@@ -156,24 +290,198 @@ class Modbus_device(object):
         string = f"{name}: {str(value)} {unit}"
         return string
 
-    def read_all(self) -> list:
+    def read_block(self, start: int, count: int) -> ReadHoldingRegistersResponse:
+        """Read a block of consecutive registers with a single request
+
+        Args:
+            start (int): Address of the first register
+            count (int): Number of registers to read
+
+        Returns:
+            ReadHoldingRegistersResponse: Response of the device
+        """
+        client, lock = self._session()
+        with lock:
+            return self._read_block(client, start, count)
+
+    def _read_block(self, client: ModbusClient, start: int, count: int) -> ReadHoldingRegistersResponse:
+        return self._request(client, lambda: self._read_holding_registers(client, start, count), self._connection_lost)
+
+    def _request(self, client: ModbusClient, request, lost) -> object:
+        # Send a request with at most one reconnect: before it if the socket is closed,
+        # otherwise after it if lost(result) shows that the connection was lost.
+        # Returns the result of request() or None if the connection could not be opened.
+        reconnected = client.socket is None
+        if reconnected and not self._reconnect(client):
+            return None
+        result = request()
+        if not reconnected and lost(result) and self._reconnect(client):
+            result = request()
+        return result
+
+    @staticmethod
+    def _connection_lost(response) -> bool:
+        # No response or an IO error (instead of an exception response of the device)
+        return response is None or isinstance(response, ModbusIOException)
+
+    def _read_holding_registers(self, client: ModbusClient, start: int, count: int) -> ReadHoldingRegistersResponse:
+        try:
+            return client.read_holding_registers(start, count=count, unit=self.UnitID)
+        except ConnectionException as e:
+            logger.error("Error reading %s, %s", client, e)
+            return None
+
+    @staticmethod
+    def group_registers(registers: list, max_gap: int = 0) -> list:
+        """Group registers into blocks which can be read with a single request
+
+        Args:
+            registers (list): Registers to group
+            max_gap (int, optional): Maximum number of unused registers between two registers of a block. Defaults to 0.
+
+        Returns:
+            list: List of blocks. [[start, count, [register, ...]], ... ]
+        """
+        blocks = []
+        for register in sorted(registers, key=lambda r: r.address):
+            if blocks:
+                block = blocks[-1]
+                end = max(block[0] + block[1], register.address + register.length)
+                if register.address <= block[0] + block[1] + max_gap and end - block[0] <= MAX_BLOCK_LENGTH:
+                    block[1] = end - block[0]
+                    block[2].append(register)
+                    continue
+            blocks.append([register.address, register.length, [register]])
+        return blocks
+
+    def read_blocks(self, registers: list, max_gap: int = 0):
+        """Update the data of registers with one request per block of registers
+
+        Registers of a block the device rejected are read one by one.
+        Registers of a block which failed because the connection is lost are marked with error.
+        Registers with data younger than their ttl are not read.
+
+        Args:
+            registers (list): Registers to read
+            max_gap (int, optional): Maximum number of unused registers between two registers of a block. Defaults to 0.
+        """
+        registers = [r for r in registers if not r.is_cached()]
+        if not registers:
+            return
+        client, lock = self._session()
+        for start, count, block_registers in self.group_registers(registers, max_gap):
+            with lock:
+                response = self._read_block(client, start, count)
+                if self._connection_lost(response):
+                    logger.error("Error reading block %s-%s, connection lost", start, start+count-1)
+                    for register in block_registers:
+                        register.error = 1
+                    continue
+                if response.isError():
+                    logger.error("Error reading block %s-%s, response: %s", start, start+count-1, response)
+                    for register in block_registers:
+                        register.get_data(client, self.UnitID)
+                    continue
+            data = response.registers
+            buffer = TC.words_to_buffer(data) # One buffer per block, registers get views into it
+            for register in block_registers:
+                offset = register.address - start
+                if register._unpack_fmt is not None:
+                    register.update_view(buffer[offset:offset+register.length])
+                else:
+                    register.update(data[offset:offset+register.length])
+
+    @property
+    def polling(self) -> bool:
+        """True while the background poller is running"""
+        return self._poller is not None and self._poller.is_alive()
+
+    def poll(self, max_gap: int = 0):
+        """Read all registers whose scan interval elapsed
+
+        Args:
+            max_gap (int, optional): Maximum number of unused registers read between two registers of one request. Defaults to 0.
+        """
+        now = time.monotonic()
+        due = [r for r in list(self.registers.values()) if r.scan_interval and now >= r._next_due]
+        self.read_blocks(due, max_gap)
+        for register in due:
+            register._next_due = now + register.scan_interval
+
+    def _poller_loop(self, max_gap: int):
+        while not self._poller_stop.is_set():
+            try:
+                self.poll(max_gap)
+            except Exception as e:
+                logger.error("Error polling %s, Exception: %s", self.ipAddress, e)
+            next_due = min((r._next_due for r in list(self.registers.values()) if r.scan_interval), default=time.monotonic() + 1.0)
+            self._poller_stop.wait(min(max(next_due - time.monotonic(), 0.0), 1.0))
+
+    def start_poller(self, max_gap: int = 0):
+        """Start a background thread which reads every register with a scan interval periodically.
+        While the poller is running, read and read_value return the polled data of these registers.
+
+        Args:
+            max_gap (int, optional): Maximum number of unused registers read between two registers of one request. Defaults to 0.
+        """
+        if self.polling:
+            return
+        self.poll(max_gap) # Init values
+        self._poller_stop.clear()
+        self._poller = threading.Thread(target=self._poller_loop, args=(max_gap,), daemon=True)
+        self._poller.start()
+
+    def stop_poller(self):
+        """Stop the background poller
+        """
+        if self._poller is None:
+            return
+        self._poller_stop.set()
+        if self._poller is not threading.current_thread():
+            self._poller.join()
+        self._poller = None
+
+    def _unpolled(self, registers) -> list:
+        # While the poller runs, registers with a scan interval use the polled data
+        if not self.polling:
+            return list(registers)
+        return [r for r in registers if not r.scan_interval]
+
+    def read_all(self, max_gap: int = 0) -> list:
         """Read all modbus registers
 
+        Args:
+            max_gap (int, optional): Maximum number of unused registers read between two registers of one request. Defaults to 0.
+
         Returns:
             list: List of all values. [[Name, value], ... ]
         """
+        self.read_blocks(self._unpolled(self.registers.values()), max_gap)
+        return [[name, register.value if register.error else register.decode(), register.unit or ""] for name, register in self.registers.items()]
+
+    def read_changed(self, max_gap: int = 0) -> list:
+        """Read all modbus registers and return only values which changed since the last call
+
+        Args:
+            max_gap (int, optional): Maximum number of unused registers read between two registers of one request. Defaults to 0.
+
+        Returns:
+            list: List of changed values. [[Name, value], ... ]
+        """
+        self.read_blocks(self._unpolled(self.registers.values()), max_gap)
         ret_val = []
-        for i in self.registers:
-            if self.registers[i].unit :
-                ret_val.append([i, round(self.read_value(i),2), self.registers[i].unit])
-            else:
-                ret_val.append([i, round(self.read_value(i),2), ""])
-            pass
-        pass
+        for name, register in self.registers.items():
+            value = register.value if register.error else register.decode() # float values are rounded to 2 decimals already
+            if value != register._prev_value:
+                register._prev_value = value
+                ret_val.append([name, value, register.unit or ""])
         return ret_val
 
 class Modbus_register:
-    def __init__(self, address: int, length: int, signed: bool, factor: float, type_: str, unit: str):
+    __slots__ = ("address", "length", "response", "_data", "error", "signed", "factor", "type", "unit", "value",
+                 "_prev_value", "_unpack_fmt", "_decode", "ttl", "_ts", "scan_interval", "_next_due")
+
+    def __init__(self, address: int, length: int, signed: bool, factor: float, type_: str, unit: str, ttl: float = 0.0, scan_interval: float = 0.0):
         """Create modbus register
 
         Args:
@@ -183,17 +491,26 @@ class Modbus_register:
             factor (float): Factor of the register data
             type_ (str): Datatype of the register data
             unit (str): Unit of the register value
+            ttl (float, optional): Time in seconds the data is reused without reading the device. Defaults to 0.0.
+            scan_interval (float, optional): Interval in seconds the register is read by the poller of the device. Defaults to 0.0.
         """
         self.address:int = address
         self.length:int = length
         self.response:ReadHoldingRegistersResponse = ReadHoldingRegistersResponse()
-        self.data:list[int] = []
+        self._data:list[int] = [] # list or memoryview into the buffer of a block read
         self.error = 0
         self.signed:bool = signed
         self.factor:float = factor
         self.type:str = type_
         self.unit:str = unit
         self.value = None
+        self._prev_value = None
+        self._unpack_fmt:str = TC.word_format(length, signed)
+        self._decode = self._build_decoder()
+        self.ttl:float = ttl
+        self._ts:float = None # monotonic time of the last read, None if the data is not valid
+        self.scan_interval:float = scan_interval
+        self._next_due:float = 0.0
 
     def read(self, client:ModbusClient, unitID: int) -> int:
         """Read the register
@@ -208,15 +525,59 @@ class Modbus_register:
         self.error = 0
         try:
             self.response = client.read_holding_registers(self.address,count=self.length, unit=unitID)
-        except BaseException as e:
+        except (ConnectionException, ModbusIOException) as e:
+            self.response = None
+            logger.error("Error reading %s, %s", client, e)
+        if self.response is None or self.response.isError():
             self.error = 1
-            logger.error("Error reading "+str(client)+", "+str(e))
-        assert(not self.response.isError())
+            return None
         return self.response
 
+    def is_cached(self) -> bool:
+        """Check if the data of the register is younger than its ttl
+
+        Returns:
+            bool: True if the data can be used without reading the device
+        """
+        return bool(self.ttl) and self._ts is not None and (time.monotonic() - self._ts) < self.ttl
+
+    @property
+    def data(self) -> list:
+        """Data of the register, a list is only created from a view when it is requested"""
+        data = self._data
+        if isinstance(data, memoryview):
+            return TC.buffer_to_words(data)
+        return data
+
+    @data.setter
+    def data(self, data: list):
+        self._data = data
+
+    def update(self, data: list):
+        """Update self.data with data read from the device
+
+        Args:
+            data (list): Data of the register
+        """
+        self.data = data
+        self.error = 0
+        self._ts = time.monotonic()
+
+    def update_view(self, view: memoryview):
+        """Update the data with a view into the buffer of a block read from the device
+
+        Args:
+            view (memoryview): View from TC.words_to_buffer() with the words of the register
+        """
+        self._data = view
+        self.error = 0
+        self._ts = time.monotonic()
+
     def get_data(self, client:ModbusClient, unitID: int) -> int:
         """Read last data of the register and update self.data
 
+        The device is only read if the data is older than the ttl of the register.
+
         Args:
             client (modbusClient): Modbusclient of a device
             unitID (int): UnitID of the device
@@ -224,13 +585,52 @@ class Modbus_register:
         Returns:
             int: Data of the register
         """
-        self.read(client, unitID)
-        try:
-            self.data = self.response.registers
+        if self.is_cached():
             return self.data
-        except:
-            logger.error("Error reading "+str(client.host)+", register "+str(self.address))
-        pass
+        if self.read(client, unitID) is None:
+            logger.error("Error reading %s, register %s", client.host, self.address)
+            return None
+        self.update(self.response.registers)
+        return self.data
+
+    def decode(self, data: list = None) -> Union[float, int, bool]:
+        """Calculate the value of the register from its data and update self.value
+
+        Args:
+            data (list, optional): Data of the register. Defaults to the last data read from the device.
+
+        Returns:
+            float/int/bool: Value of the register, the previous value if there is no data. Datatype is specified in the register.
+        """
+        if data is None:
+            data = self._data
+        if self._decode is not None and len(data):
+            self.value = self._decode(data)
+        return self.value
+
+    def _build_decoder(self):
+        # Bind datatype, factor and struct format once, so decoding is a single call per read
+        value_type = VALUE_TYPES.get(self.type)
+        if value_type is None:
+            return None
+        fmt, length, signed, factor = self._unpack_fmt, self.length, self.signed, self.factor
+
+        def to_number(data):
+            if fmt is not None and len(data) == length:
+                if isinstance(data, memoryview):
+                    return TC.buffer_to_number(data, fmt)
+                return TC.words_to_number(data, fmt)
+            return TC.list_to_number(data, signed=signed)
+
+        if value_type is float:
+            return lambda data: round(float(to_number(data) * factor), 2)
+        if float(factor).is_integer():
+            # Integral factors of int and bool registers are scaled without a detour through float
+            factor = int(factor)
+            if factor == 1:
+                return to_number if value_type is int else lambda data: bool(to_number(data))
+            return lambda data: value_type(to_number(data) * factor)
+        return lambda data: value_type(round(float(to_number(data) * factor), 2))
 
     def write(self, client:ModbusClient, value: int, unitID: int):
         """Write data to the register
@@ -252,4 +652,5 @@ class Modbus_register:
                 raise Exception("Value too long for register. length = "+str(self.length))
         else:
             rq = client.write_registers(self.address, value, unit=unitID)
-        self.value = value
+        self.decode(value) # value as it will be read back, not the written words
+        self._ts = None
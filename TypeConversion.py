@@ -1,5 +1,78 @@
 from math import floor
+import array
 import copy
+import struct
+import sys
+
+WORD_FORMATS = { # struct formats of big endian integers, key: (wordlength, signed)
+    (1, False): ">H",
+    (1, True): ">h",
+    (2, False): ">I",
+    (2, True): ">i",
+    (4, False): ">Q",
+    (4, True): ">q",
+}
+
+def word_format(length, signed=False):
+    """Get the struct format of an integer with the given wordlength
+
+    Args:
+        length (int): Wordlength of the integer
+        signed (bool, optional): True if the integer is signed. Defaults to False.
+
+    Returns:
+        str: struct format or None if there is no format for the wordlength
+    """
+    return WORD_FORMATS.get((length, signed))
+
+def words_to_number(words, fmt):
+    """Convert list of 16-bit integers to a single integer with a struct format
+
+    Args:
+        words (list): List to be converted, the length has to match the format
+        fmt (str): struct format from word_format()
+
+    Returns:
+        int: Converted list to a single integer
+    """
+    return struct.unpack(fmt, struct.pack(">%dH" % len(words), *words))[0]
+
+def words_to_buffer(words):
+    """Convert list of 16-bit integers to a big endian buffer without copying it per word
+
+    Args:
+        words (list): List of 16-bit integers
+
+    Returns:
+        memoryview: Buffer of the words, slicing it does not copy the data
+    """
+    buffer = array.array("H", words)
+    if sys.byteorder == "little":
+        buffer.byteswap()
+    return memoryview(buffer)
+
+def buffer_to_number(buffer, fmt):
+    """Convert a big endian buffer of 16-bit integers to a single integer with a struct format
+
+    Args:
+        buffer (memoryview): Buffer from words_to_buffer()
+        fmt (str): struct format from word_format()
+
+    Returns:
+        int: Converted buffer to a single integer
+    """
+    return struct.unpack_from(fmt, buffer)[0]
+
+def buffer_to_words(buffer):
+    """Convert a big endian buffer of 16-bit integers to a list
+
+    Args:
+        buffer (memoryview): Buffer from words_to_buffer()
+
+    Returns:
+        list: List of 16-bit integers
+    """
+    return list(struct.unpack(">%dH" % len(buffer), buffer))
 
 def list_to_number(number, length=2, signed=False): #little endian
     """Convert list of integers to a single integer
@@ -12,6 +85,9 @@ def list_to_number(number, length=2, signed=False): #little endian
     Returns:
         int: Converted list to a single integer
     """
+    fmt = WORD_FORMATS.get((len(number), signed))
+    if fmt is not None:
+        return words_to_number(number, fmt)
     unsigned_number = 0
     number_length = len(number)-1
     for i in range(number_length, -1, -1):
@@ -41,6 +117,12 @@ def number_to_wordList(number, signed=False, size=1):
     Returns:
         list: List of 16-bit integers representing the input number
     """
+    fmt = WORD_FORMATS.get((size, signed))
+    if fmt is not None:
+        try:
+            return list(struct.unpack(">%dH" % size, struct.pack(fmt, number)))
+        except struct.error:
+            pass # number does not fit into size words
     numberInternal = copy.copy(number)
     if numberInternal == 0:
         return [0]*size
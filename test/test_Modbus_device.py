@@ -0,0 +1,329 @@
+import time
+import unittest
+from unittest import mock
+
+from pymodbus.exceptions import ModbusIOException
+from pymodbus.pdu import ExceptionResponse
+from pymodbus.register_read_message import ReadHoldingRegistersResponse
+
+import Modbus
+from Modbus import MAX_BLOCK_LENGTH, Modbus_device, Modbus_register
+
+
+class FakeSocket:
+    def setsockopt(self, *args):
+        pass
+
+
+class FakeClient:
+    """Stand-in for ModbusTcpClient with 200 holding registers holding their own address"""
+    def __init__(self, host, port=502):
+        self.host = host
+        self.port = port
+        self.socket = None
+        self.online = True
+        self.memory = list(range(200))
+        self.requests = []
+        self.connects = 0
+
+    def connect(self):
+        self.connects += 1
+        if self.online:
+            self.socket = self.socket or FakeSocket()
+        return self.socket is not None
+
+    def close(self):
+        self.socket = None
+
+    def read_holding_registers(self, address, count=1, unit=1):
+        self.requests.append((address, count))
+        if not self.online:
+            self.socket = None
+            return ModbusIOException("Connection lost")
+        if address + count > len(self.memory):
+            return ExceptionResponse(0x03, 0x02)
+        return ReadHoldingRegistersResponse(self.memory[address:address+count])
+
+    def write_registers(self, address, values, unit=1):
+        self.memory[address:address+len(values)] = values
+
+
+class DeviceTestCase(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(Modbus, "ModbusClient", FakeClient)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        sleep = mock.patch.object(Modbus.time, "sleep")
+        sleep.start()
+        self.addCleanup(sleep.stop)
+        self.addCleanup(Modbus_device._client_pool.clear)
+        self.device = Modbus_device("192.0.2.1")
+        self.addCleanup(self.device.close)
+        self.client = self.device.client
+
+
+def register(address, length, signed=False, factor=1, type_="int"):
+    return Modbus_register(address, length, signed, factor, type_, "")
+
+
+def blocks(registers, max_gap=0):
+    return [(start, count, [r.address for r in regs]) for start, count, regs in Modbus_device.group_registers(registers, max_gap)]
+
+
+class TestGroupRegisters(unittest.TestCase):
+    def test_contiguous(self):
+        registers = [register(12, 1), register(10, 2), register(13, 2)]
+        self.assertEqual(blocks(registers), [(10, 5, [10, 12, 13])])
+
+    def test_gap(self):
+        registers = [register(10, 1), register(13, 1)]
+        self.assertEqual(blocks(registers), [(10, 1, [10]), (13, 1, [13])])
+        self.assertEqual(blocks(registers, max_gap=1), [(10, 1, [10]), (13, 1, [13])])
+        self.assertEqual(blocks(registers, max_gap=2), [(10, 4, [10, 13])])
+
+    def test_overlap(self):
+        registers = [register(10, 4), register(11, 1)]
+        self.assertEqual(blocks(registers), [(10, 4, [10, 11])])
+
+    def test_block_length(self):
+        registers = [register(0, 100), register(100, MAX_BLOCK_LENGTH - 100), register(MAX_BLOCK_LENGTH, 1)]
+        self.assertEqual(blocks(registers), [(0, MAX_BLOCK_LENGTH, [0, 100]), (MAX_BLOCK_LENGTH, 1, [MAX_BLOCK_LENGTH])])
+        registers = [register(0, 100), register(110, 20)]
+        self.assertEqual(blocks(registers, max_gap=20), [(0, 100, [0]), (110, 20, [110])])
+
+    def test_empty(self):
+        self.assertEqual(blocks([]), [])
+
+
+class TestTtl(DeviceTestCase):
+    def test_cached(self):
+        self.device.newRegister("a", 10, 1, ttl=60)
+        self.assertEqual(self.device.read_value("a"), 10)
+        self.client.memory[10] = 11
+        self.assertEqual(self.device.read_value("a"), 10)
+        self.assertEqual(self.device.read_all(), [["a", 10, ""]])
+        self.assertEqual(len(self.client.requests), 1)
+
+    def test_expired(self):
+        self.device.newRegister("a", 10, 1, ttl=60)
+        self.device.read_value("a")
+        self.client.memory[10] = 11
+        with mock.patch.object(Modbus.time, "monotonic", return_value=time.monotonic() + 61):
+            self.assertEqual(self.device.read_value("a"), 11)
+
+    def test_ttl_longer_than_uptime(self):
+        # monotonic() may be smaller than ttl shortly after boot
+        self.device.newRegister("a", 10, 1, ttl=time.monotonic() + 100)
+        self.assertEqual(self.device.read_value("a"), 10)
+        self.device.write_register("a", 12)
+        self.assertEqual(self.device.read_all(), [["a", 12, ""]])
+
+    def test_write_invalidates(self):
+        self.device.newRegister("a", 10, 1, ttl=60)
+        self.device.read_value("a")
+        self.device.write_register("a", 12)
+        self.assertEqual(self.device.read_value("a"), 12)
+        self.assertEqual(len(self.client.requests), 2)
+
+
+class TestFailedRead(DeviceTestCase):
+    def test_never_read(self):
+        self.device.newRegister("s", 10, 1, signed=True)
+        self.client.online = False
+        self.assertIsNone(self.device.read_value("s"))
+        self.assertEqual(self.device.read_all(), [["s", None, ""]])
+
+    def test_keeps_last_value(self):
+        self.device.newRegister("a", 10, 1)
+        self.device.newRegister("b", 11, 1, factor=0.1, type_="float")
+        self.device.read_all()
+        self.client.online = False
+        self.assertEqual(self.device.read_all(), [["a", 10, ""], ["b", 1.1, ""]])
+        self.assertEqual(self.device.read_value("b"), 1.1)
+
+    def test_keeps_written_value(self):
+        self.device.newRegister("w", 10, 2, factor=0.1, type_="float")
+        self.device.write_register("w", 5)
+        self.client.online = False
+        self.assertEqual(self.device.read_value("w"), 5.0)
+        self.assertEqual(self.device.read_all(), [["w", 5.0, ""]])
+
+
+class TestClientPool(DeviceTestCase):
+    def test_shared_client(self):
+        other = Modbus_device("192.0.2.1", unitID=2)
+        self.assertIs(other.client, self.client)
+        self.assertIs(other.lock, self.device.lock)
+        self.assertEqual(Modbus_device._client_pool[("192.0.2.1", 502)][2], 2)
+        third = Modbus_device("192.0.2.1", port="1502")
+        self.assertIsNot(third.client, self.client)
+        third.close()
+        other.close()
+        self.assertIsNotNone(self.client.socket)
+
+    def test_close_last_device(self):
+        other = Modbus_device("192.0.2.1", unitID=2)
+        self.device.close()
+        self.device.close()
+        self.assertIsNone(self.device.client)
+        self.assertEqual(Modbus_device._client_pool[("192.0.2.1", 502)][2], 1)
+        other.close()
+        self.assertIsNone(self.client.socket)
+        self.assertEqual(Modbus_device._client_pool, {})
+
+    def test_read_after_close(self):
+        self.device.newRegister("a", 10, 1)
+        self.device.close()
+        self.assertEqual(self.device.read_value("a"), 10)
+        client = self.device.client
+        self.assertIsNot(client, self.client)
+        self.assertEqual(Modbus_device._client_pool[("192.0.2.1", 502)], [client, self.device.lock, 1])
+        self.device.close()
+        self.assertIsNone(client.socket)
+        self.assertEqual(Modbus_device._client_pool, {})
+
+
+class TestReconnect(DeviceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.device.newRegister("a", 10, 1)
+        self.device.newRegister("b", 11, 1)
+        self.device.read_all()
+        # Link is down and the socket was closed
+        self.client.online = False
+        self.client.socket = None
+        self.client.requests.clear()
+        self.client.connects = 0
+
+    def test_read_without_connection(self):
+        self.assertIsNone(self.device.read("a"))
+        self.assertEqual(self.device.registers["a"].error, 1)
+        self.assertEqual(self.client.connects, Modbus.RECONNECT_RETRIES)
+        self.assertEqual(self.client.requests, [])
+
+    def test_read_all_without_connection(self):
+        self.assertEqual(self.device.read_all(), [["a", 10, ""], ["b", 11, ""]])
+        self.assertEqual(self.client.connects, Modbus.RECONNECT_RETRIES)
+        self.assertEqual(self.client.requests, [])
+
+    def test_reconnect_once(self):
+        # Reconnect succeeds, but the link drops again on the request
+        self.client.online = True
+        self.client.read_holding_registers = mock.Mock(return_value=ModbusIOException("Connection lost"))
+        self.assertIsNone(self.device.read("a"))
+        self.assertEqual(self.client.read_holding_registers.call_count, 1)
+        self.assertEqual(self.client.connects, 1)
+
+    def test_block_reconnect_once(self):
+        self.client.online = True
+        self.client.read_holding_registers = mock.Mock(return_value=ModbusIOException("Connection lost"))
+        self.assertEqual(self.device.read_all(), [["a", 10, ""], ["b", 11, ""]])
+        self.assertEqual(self.client.read_holding_registers.call_count, 1)
+        self.assertEqual(self.client.connects, 1)
+
+    def test_retry_after_lost_connection(self):
+        # Socket looks open, the request shows the connection was lost
+        self.client.socket = FakeSocket()
+        self.client.online = True
+        responses = [ModbusIOException("Connection lost"), ReadHoldingRegistersResponse([10])]
+        self.client.read_holding_registers = mock.Mock(side_effect=responses)
+        self.assertEqual(self.device.read("a"), [10])
+        self.assertEqual(self.client.connects, 1)
+
+    def test_write_without_connection(self):
+        self.device.write_register("a", 5)
+        self.assertEqual(self.client.memory[10], 10)
+
+    def test_keepalive_after_reconnect(self):
+        self.client.online = True
+        socket = FakeSocket()
+        socket.setsockopt = mock.Mock()
+        self.client.connect = lambda: setattr(self.client, "socket", socket) or True
+        self.assertEqual(self.device.read("a"), [10])
+        self.assertTrue(socket.setsockopt.called)
+
+
+class TestPoller(DeviceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.device.newRegister("fast", 10, 1, scan_interval=1)
+        self.device.newRegister("slow", 11, 1, scan_interval=60)
+        self.device.newRegister("other", 12, 1)
+
+    def test_schedule(self):
+        now = time.monotonic()
+        with mock.patch.object(Modbus.time, "monotonic", return_value=now):
+            self.device.poll()
+        self.assertEqual(self.client.requests, [(10, 2)])
+        with mock.patch.object(Modbus.time, "monotonic", return_value=now + 2):
+            self.device.poll()
+        self.assertEqual(self.client.requests, [(10, 2), (10, 1)])
+        with mock.patch.object(Modbus.time, "monotonic", return_value=now + 2.5):
+            self.device.poll()
+        self.assertEqual(len(self.client.requests), 2)
+
+    def test_reads_use_polled_data(self):
+        self.device.start_poller()
+        self.assertTrue(self.device.polling)
+        self.client.requests.clear()
+        self.assertEqual(self.device.read_value("slow"), 11)
+        self.assertEqual(self.device.read_all(), [["fast", 10, ""], ["slow", 11, ""], ["other", 12, ""]])
+        self.assertIn((12, 1), self.client.requests)
+        self.assertEqual([r for r in self.client.requests if r[0] <= 11 < r[0] + r[1]], [])
+
+    def test_failed_poll(self):
+        self.client.online = False
+        self.device.start_poller()
+        self.assertIsNone(self.device.read_value("slow"))
+        self.assertIsNone(self.device.read("slow"))
+
+    def test_stop_on_close(self):
+        self.device.start_poller()
+        poller = self.device._poller
+        self.device.close()
+        self.assertFalse(self.device.polling)
+        self.assertFalse(poller.is_alive())
+
+
+class TestReadChanged(DeviceTestCase):
+    def test_deltas(self):
+        self.device.newRegister("a", 10, 1)
+        self.device.newRegister("b", 11, 1, factor=0.001, type_="float", unit="kWh")
+        self.assertEqual(self.device.read_changed(), [["a", 10, ""], ["b", 0.01, "kWh"]])
+        self.assertEqual(self.device.read_changed(), [])
+        self.client.memory[10] = 20
+        self.client.memory[11] = 12 # same value after rounding to 2 decimals
+        self.assertEqual(self.device.read_changed(), [["a", 20, ""]])
+
+    def test_failed_read(self):
+        self.device.newRegister("a", 10, 1)
+        self.device.read_changed()
+        self.client.online = False
+        self.assertEqual(self.device.read_changed(), [])
+
+
+class TestValidateAll(DeviceTestCase):
+    def test_new_register_not_read(self):
+        self.assertTrue(self.device.newRegister("a", 10, 1))
+        self.assertTrue(self.device.newRegister("bad", 500, 1))
+        self.assertEqual(self.client.requests, [])
+
+    def test_error_marking(self):
+        self.device.newRegister("a", 10, 1)
+        self.device.newRegister("b", 11, 1)
+        self.device.newRegister("bad", 199, 2)
+        self.assertEqual(self.device.validate_all(), ["bad"])
+        self.assertEqual([r.error for r in self.device.registers.values()], [0, 0, 1])
+        # One request per block, the rejected block is read register by register
+        self.assertEqual(self.client.requests, [(10, 2), (199, 2), (199, 2)])
+
+    def test_error_cleared(self):
+        self.device.newRegister("a", 10, 1)
+        self.client.online = False
+        self.assertEqual(self.device.validate_all(), ["a"])
+        self.client.online = True
+        self.assertEqual(self.device.validate_all(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+
+import TypeConversion as TC
+from Modbus import Modbus_register
+
+
+def register(address, length, signed=False, factor=1, type_="int"):
+    return Modbus_register(address, length, signed, factor, type_, "")
+
+
+class TestDecode(unittest.TestCase):
+    def test_types(self):
+        data = [65535, 65531]
+        self.assertEqual(register(0, 2, signed=True).decode(data), -5)
+        self.assertEqual(register(0, 2, signed=True, factor=0.1, type_="float").decode(data), -0.5)
+        self.assertIs(register(0, 2, signed=True, type_="bool").decode(data), True)
+        self.assertIs(register(0, 1, type_="bool").decode([0]), False)
+        self.assertEqual(register(0, 2).decode(data), 4294967291)
+
+    def test_length_without_format(self):
+        self.assertEqual(register(0, 3).decode([1, 2, 3]), (1 << 32) + (2 << 16) + 3)
+
+    def test_unknown_type(self):
+        self.assertIsNone(register(0, 1, type_="str").decode([1]))
+
+    def test_no_data(self):
+        self.assertIsNone(register(0, 1, signed=True).decode([]))
+        reg = register(0, 1)
+        reg.decode([7])
+        self.assertEqual(reg.decode([]), 7)
+
+    def test_updates_value(self):
+        reg = register(0, 1, factor=0.5, type_="float")
+        reg.decode([7])
+        self.assertEqual(reg.value, 3.5)
+
+
+class TestFactor(unittest.TestCase):
+    def test_integral_factor(self):
+        self.assertEqual(register(0, 2, signed=True, factor=10).decode([65535, 65531]), -50)
+        self.assertEqual(register(0, 1, factor=1.0).decode([7]), 7)
+        self.assertIs(type(register(0, 1, factor=10).decode([7])), int)
+        self.assertIs(register(0, 1, factor=10, type_="bool").decode([7]), True)
+
+    def test_large_number_stays_exact(self):
+        # 2**63 - 1 is not representable as float
+        self.assertEqual(register(0, 4, signed=True).decode([32767, 65535, 65535, 65535]), 2**63 - 1)
+
+    def test_fractional_factor(self):
+        # Rounded to 2 decimals before the conversion to int
+        self.assertEqual(register(0, 1, factor=0.001).decode([999]), 1)
+        self.assertEqual(register(0, 1, factor=2.5, type_="float").decode([3]), 7.5)
+
+
+class TestView(unittest.TestCase):
+    def test_decode_view(self):
+        buffer = TC.words_to_buffer([1, 65535, 65531])
+        reg = register(1, 2, signed=True)
+        reg.update_view(buffer[1:3])
+        self.assertEqual(reg.decode(), -5)
+        self.assertEqual(register(1, 2, signed=True, factor=0.1, type_="float").decode(buffer[1:3]), -0.5)
+
+    def test_data_property(self):
+        reg = register(1, 2)
+        reg.update_view(TC.words_to_buffer([1, 2, 3])[1:3])
+        self.assertEqual(reg.data, [2, 3])
+        reg.update([4, 5])
+        self.assertEqual(reg.data, [4, 5])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+
+import TypeConversion as TC
+
+
+class TestRoundTrip(unittest.TestCase):
+    def test_unsigned(self):
+        for length in (1, 2, 4):
+            for number in (0, 1, 0x1234, 2**(16*length) - 1):
+                words = TC.number_to_wordList(number, signed=False, size=length)
+                self.assertEqual(len(words), length)
+                self.assertEqual(TC.list_to_number(words, signed=False), number)
+
+    def test_signed(self):
+        for length in (1, 2, 4):
+            limit = 2**(16*length - 1)
+            for number in (0, 1, -1, -2560, limit - 1, -limit):
+                words = TC.number_to_wordList(number, signed=True, size=length)
+                self.assertEqual(len(words), length)
+                self.assertEqual(TC.list_to_number(words, signed=True), number)
+
+    def test_padding(self):
+        self.assertEqual(TC.number_to_wordList(5, size=2), [0, 5])
+        self.assertEqual(TC.number_to_wordList(-5, signed=True, size=2), [65535, 65531])
+
+    def test_words_to_number(self):
+        self.assertEqual(TC.words_to_number([65535, 65531], TC.word_format(2, True)), -5)
+        self.assertEqual(TC.words_to_number([1, 2], TC.word_format(2, False)), 65538)
+
+
+class TestFallback(unittest.TestCase):
+    def test_number_too_long(self):
+        # Does not fit into 2 words, falls back to the loop which returns all words
+        self.assertEqual(TC.number_to_wordList(4295163912, signed=True, size=2), [1, 3, 8])
+
+    def test_out_of_range(self):
+        self.assertEqual(TC.number_to_wordList(40000, signed=True, size=1), [40000])
+        self.assertEqual(TC.number_to_wordList(-2560, signed=False, size=1), [62976])
+
+    def test_no_format(self):
+        self.assertIsNone(TC.word_format(3))
+        self.assertEqual(TC.list_to_number([1, 2, 3]), (1 << 32) + (2 << 16) + 3)
+        self.assertEqual(TC.number_to_wordList(0, size=3), [0, 0, 0])
+
+
+class TestBuffer(unittest.TestCase):
+    def setUp(self):
+        self.buffer = TC.words_to_buffer([1, 2, 3, 65535, 65534])
+
+    def test_buffer_to_number(self):
+        self.assertEqual(TC.buffer_to_number(self.buffer[0:1], TC.word_format(1)), 1)
+        self.assertEqual(TC.buffer_to_number(self.buffer[1:3], TC.word_format(2)), (2 << 16) + 3)
+        self.assertEqual(TC.buffer_to_number(self.buffer[3:5], TC.word_format(2, True)), -2)
+        self.assertEqual(TC.buffer_to_number(self.buffer[4:5], TC.word_format(1, True)), -2)
+
+    def test_buffer_to_words(self):
+        self.assertEqual(TC.buffer_to_words(self.buffer[2:4]), [3, 65535])
+        self.assertEqual(TC.buffer_to_words(self.buffer), [1, 2, 3, 65535, 65534])
+
+
+if __name__ == "__main__":
+    unittest.main()